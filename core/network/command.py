@@ -22,6 +22,7 @@ The current implementation of this module is not thread safe.
 # This project is hosted at sdss3.org and tops.googlecode.com
 
 from collections import deque
+from itertools import islice
 from twisted.internet.defer import Deferred
 
 class CommandException(Exception):
@@ -89,6 +90,17 @@ class CommandQueue(object):
 			self.issue(command.payload)
 		return command.deferred
 	
+	def peek(self,count):
+		"""
+		Returns the payloads of up to count queued commands.
+
+		The commands are not removed from the queue; they will still be
+		issued in FIFO order as usual. This lets a subclass transmit
+		queued payloads ahead of time (pipelining) while completion
+		bookkeeping stays with the queue.
+		"""
+		return [command.payload for command in islice(self.queued,count)]
+
 	def done(self,response=None):
 		"""
 		Signals the successful completion of the current command.
@@ -28,23 +28,30 @@ class LogRecord(object):
 		self.when = datetime.fromtimestamp(self.timestamp)
 		# we assume that these are valid names
 		self.source = hdr.name + '.' + msg.source if msg.source else hdr.name
-		self.msg = msg
-		self.hdr = hdr
+		# Copy everything we need out of the protobuf message up front so
+		# that filtering and serving this record never goes back through
+		# the protobuf field machinery (and so msg may be a reused scratch
+		# instance that the next payload overwrites).
+		self.levelno = msg.levelno
+		self.body = msg.body
+		self.exception = msg.exception
+		if msg.HasField('context'):
+			context = msg.context
+			self.context = (context.filename,context.lineno,context.funcname)
+		else:
+			self.context = None
 		self.cached_json = None
 
 	def json(self):
 		if self.cached_json:
 			return self.cached_json
-		msg = self.msg
-		if msg.HasField('context'):
-			context = msg.context
-			json_context = ('{"file":"%s","line":%d,"func":"%s"}' %
-				(context.filename,context.lineno,context.funcname))
+		if self.context:
+			json_context = '{"file":"%s","line":%d,"func":"%s"}' % self.context
 		else:
 			json_context = 'null'
-		json_exception = '"%s"' % msg.exception if msg.exception else 'null'
+		json_exception = '"%s"' % self.exception if self.exception else 'null'
 		# See http://www.json.org/ for string escaping rules
-		escaped_body = (msg.body
+		escaped_body = (self.body
 			.replace('\\', r'\\')
 			.replace('"', r'\"')
 			.replace('\b', r'\b')
@@ -54,13 +61,13 @@ class LogRecord(object):
 			.replace('\t', r'\t'))
 		self.cached_json = (
 			'{"tstamp":%d,"level":"%s","source":"%s","body":"%s"}' %
-			(int(1000*self.timestamp),logging.getLevelName(msg.levelno).replace(' ','_'),
+			(int(1000*self.timestamp),logging.getLevelName(self.levelno).replace(' ','_'),
 			self.source,escaped_body)
 		)
 		return self.cached_json
 
 	def __str__(self):
-		return '[%02d] %s (%s) %s' % (self.msg.levelno,self.when,self.source,self.msg.body)
+		return '[%02d] %s (%s) %s' % (self.levelno,self.when,self.source,self.body)
 
 class LogFilter(object):
 	"""
@@ -80,11 +87,14 @@ class LogFilter(object):
 			self.minLevel = logging.NOTSET
 
 	def selects(self,record):
+		# alias the per-record attributes once; this runs for every
+		# buffered record on every feed dump
+		timestamp = record.timestamp
 		selected = (
-			(record.timestamp > self.last) and
-			(record.msg.levelno >= self.minLevel) and
+			(timestamp > self.last) and
+			(record.levelno >= self.minLevel) and
 			(self.sourcePattern.matches(record.source))
 		)
-		if record.timestamp > self.last:
-			self.last = record.timestamp
+		if timestamp > self.last:
+			self.last = timestamp
 		return selected
\ No newline at end of file
@@ -19,10 +19,16 @@ from twisted.python import log
 
 from collections import deque
 from record import *
-from datetime import datetime,timedelta
+from time import time
 
 from logging import DEBUG
 
+# Select the C++ protobuf backend before any *_pb2 module is imported.
+# The pure-Python decoder is many times slower and taxes every message
+# received by the server.
+import os
+os.environ.setdefault('PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION','cpp')
+
 import logging_pb2
 
 class FeedBuffer(object):
@@ -31,33 +37,58 @@ class FeedBuffer(object):
 	"""
 	def __init__(self,maxdepth=100):
 		self.maxdepth = maxdepth
-		self.buffer = deque()
+		# a bounded deque discards the oldest record automatically on append
+		self.buffer = deque(maxlen=maxdepth)
 		self.hdr = logging_pb2.Header()
 		self.hdr.name = 'logging.server'
 		self.msgCount = 0
-		self.starttime = datetime.now()
+		self.lastStatusCount = -1
+		self.starttime = time()
 		LoopingCall(self.statusMessage).start(60.0)
 
 	def add(self,record):
+		# serialize once at add time so dumps only ever join pre-built
+		# strings, amortizing the JSON cost across all watcher sessions
+		record.json()
 		self.buffer.append(record)
-		if len(self.buffer) > self.maxdepth:
-			self.buffer.popleft()
 		self.msgCount += 1
 
 	def dump(self,filt):
-		items = ',\n\t'.join([r.json() for r in self.buffer if filt.selects(r)])
-		return '({"items":[' + items + ']})'
+		"""
+		Generates the JSON response for the records selected by filt.
+
+		Yields the response as a sequence of string chunks so a consumer
+		can stream them to a transport without building one big string.
+		"""
+		yield '({"items":['
+		first = True
+		# bind the predicate once and run the selection loop in C
+		for record in filter(filt.selects,self.buffer):
+			if not first:
+				yield ',\n\t'
+			yield record.cached_json
+			first = False
+		yield ']})'
 
 	def statusMessage(self):
+		# skip the protobuf and record overhead when nothing has happened
+		# since the last status tick (and avoid displacing real records)
+		if self.msgCount == self.lastStatusCount:
+			return
 		msg = logging_pb2.Message()
 		msg.levelno = DEBUG
-		elapsed = datetime.now() - self.starttime
-		elapsed = timedelta(elapsed.days,elapsed.seconds)
-		msg.body = 'Server has been running %s and handled %u messages.' % (elapsed,self.msgCount) 
+		# plain seconds arithmetic is much cheaper than datetime subtraction
+		(days,rem) = divmod(int(time() - self.starttime),86400)
+		(hours,rem) = divmod(rem,3600)
+		(minutes,seconds) = divmod(rem,60)
+		msg.body = ('Server has been running %d days, %d:%02d:%02d and handled %u messages.'
+			% (days,hours,minutes,seconds,self.msgCount))
 		self.add(LogRecord(msg,self.hdr))
+		self.lastStatusCount = self.msgCount
 
 
-from tops.core.network.webserver import WebQuery,prepareWebServer
+from tops.core.network.webserver import WebQuery,prepareWebServer,ChunkProducer
+from twisted.web.server import NOT_DONE_YET
 
 class FeedUpdate(WebQuery):
 	"""
@@ -71,7 +102,9 @@ class FeedUpdate(WebQuery):
 		if not hasattr(state,'filter'):
 			print 'cannot serve GET requests before a filter has been specified'
 			return '({"items":[]})'
-		return session.site.feed.dump(state.filter)
+		# stream the response chunks instead of building one big string
+		ChunkProducer(request,session.site.feed.dump(state.filter))
+		return NOT_DONE_YET
 		
 	def POST(self,request,session,state):
 		sourceFilter = self.get_arg('sourceFilter')
@@ -91,11 +124,26 @@ class LogServer(Server):
 	"""
 	Header = logging_pb2.Header
 	Message = logging_pb2.Message
-	
+
+	def connectionMade(self):
+		Server.connectionMade(self)
+		# bind the hot per-message callables once so handleMessage avoids
+		# repeated attribute lookups on every record received
+		self._make_record = LogRecord
+		self._add = self.factory.feed.add
+		# one scratch Message reused for every payload on this connection
+		self._scratch_msg = logging_pb2.Message()
+
+	def makeMessage(self):
+		return self._scratch_msg
+
 	def handleMessage(self,msg):
-		record = LogRecord(msg,self.hdr)
-		self.factory.feed.add(record)
-		print record
+		# the feed serializes the record on add, before the reused scratch
+		# msg instance is overwritten by the next payload
+		record = self._make_record(msg,self.hdr)
+		self._add(record)
+		if self.factory.debug:
+			print record
 
 
 def initialize():
@@ -106,7 +154,17 @@ def initialize():
 	from twisted.python.logfile import LogFile
 	import sys
 	import os,os.path
-	
+
+	# Warn prominently if we ended up on the pure-Python protobuf
+	# decoder, which is many times slower than the C++ backend. This is
+	# only a performance preference, so the server still runs: the
+	# extension may be unavailable on this host, or an operator may have
+	# selected the python backend explicitly via the environment.
+	from google.protobuf.internal import api_implementation
+	if api_implementation.Type() == 'python':
+		print ('WARNING: using the pure-Python protobuf decoder;'
+			' install the C++ backend for full message throughput')
+
 	# load our run-time configuration
 	import tops.core.utility.config as config
 	verbose = config.initialize()
@@ -128,6 +186,7 @@ def initialize():
 		factory = Factory()
 		factory.protocol = LogServer
 		factory.feed = feed
+		factory.debug = verbose
 		reactor.listenTCP(config.getint('logger','tcp_port'),factory)
 		reactor.listenUNIX(config.getfilename('logger','unix_addr'),factory)
 
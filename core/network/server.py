@@ -41,12 +41,22 @@ class Server(twisted.protocols.basic.Int16StringReceiver):
 			self.hdr.ParseFromString(raw)
 			self.handleHeader(self.hdr)
 		else:
-			msg = self.Message()
+			msg = self.makeMessage()
 			msg.ParseFromString(raw)
 			self.handleMessage(msg)
 		self.msgcount += 1
 		self.bytecount += len(raw)
-		
+
+	def makeMessage(self):
+		"""
+		Returns the Message instance that the next payload is parsed into.
+
+		The default implementation allocates a fresh Message per payload.
+		Subclasses whose handleMessage copies out the fields it needs may
+		override this to reuse a single scratch instance instead.
+		"""
+		return self.Message()
+
 	def handleHeader(self,hdr):
 		pass
 
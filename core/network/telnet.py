@@ -15,6 +15,9 @@ a telnet client session. Based on the classes in twisted.conch.telnet.
 
 from twisted.conch import telnet
 from twisted.internet import defer
+from twisted.internet.interfaces import IPushProducer
+from zope.interface import implements
+import weakref
 import command
 
 class TelnetException(Exception):
@@ -44,14 +47,26 @@ class TelnetSession(telnet.TelnetProtocol,command.CommandQueue):
 	TelnetSession.do() method.
 	
 	TelnetSession relies on the services of TelnetConnection to handle
-	the low-level telnet protocol.
+	the low-level telnet protocol. Outgoing data is paced through
+	twisted's producer interface so bursts of queued commands respect the
+	transport's flow control instead of piling up in its buffers.
 	"""
+	implements(IPushProducer)
 
 	# If there are more than this number of commands queued, assume that something
 	# is broken and signal an error condition to subsequent command issuers.
 	MAX_QUEUED = 10
 
-	registry = { }
+	# The maximum number of queued commands coalesced into a single send.
+	# Pipelining commands this way amortizes the link round-trip time
+	# across the batch instead of paying one round trip per command.
+	COALESCE_MAX = 8
+
+	# Sessions register themselves here by name so that do() can find
+	# them. Weak references keep the registry from pinning dead sessions
+	# in memory (and from blocking re-use of a name) once nothing else
+	# holds onto them.
+	registry = weakref.WeakValueDictionary()
 	end_of_line = '\n'
 	
 	@staticmethod
@@ -70,53 +85,142 @@ class TelnetSession(telnet.TelnetProtocol,command.CommandQueue):
 			raise TelnetException('cannot create second session with name "%s"' % myname)
 		self.name = myname
 		self.debug = debug
-		if self.debug:
-			print 'TelnetSession: initializing "%s" (%s)' % (myname,self.__class__.__name__)
+		# Bind the trace hook once so the hot send/receive paths pay a
+		# single no-op call when debugging is off, instead of a per-packet
+		# attribute test and format at every print site.
+		self._trace = self._trace_on if debug else self._trace_off
+		self._trace('initializing (%s)',self.__class__.__name__)
 		self.registry[myname] = self
 		# remember our authentication info
 		self.username = username
 		self.password = password
+		# Cache the static prompt lengths so prompt detection is a single
+		# tail-slice comparison per chunk. command_prompt may be changed
+		# per instance (e.g. by a subclass that launches a program with
+		# its own prompt) so its length is read where it is used.
+		self._login_plen = len(self.login_prompt)
+		self._password_plen = len(self.password_prompt)
 		# initialize our state machine
 		self.state = 'CONNECTING'
+		# accumulates partially received response lines
+		self._rxbuf = ''
+		# counts commands whose payloads are already on the wire ahead of
+		# their turn in the queue
+		self._pipelined = 0
+		# outgoing data waiting for the transport to accept it
+		self._txbuf = [ ]
+		self._tx_paused = False
+		self._tx_registered = False
+		# Map each state name to its bound handler once, so dataReceived
+		# does a single dict lookup per chunk of input instead of building
+		# a method name and walking the MRO. State handlers are recognized
+		# as the session_XXX methods with an upper-case state suffix.
+		self._state_handlers = { }
+		for name in dir(self):
+			if name.startswith('session_') and name[8:].isupper():
+				self._state_handlers[name[8:]] = getattr(self,name)
 		# initialize our command queue
 		command.CommandQueue.__init__(self,self.MAX_QUEUED)
 		# telnet.TelnetProtocol has no __init__ method to call
 
+	def _trace_off(self,fmt,*args):
+		"""
+		Does nothing; bound as self._trace when debugging is off.
+		"""
+		pass
+
+	def _trace_on(self,fmt,*args):
+		"""
+		Prints a debug message; bound as self._trace when debugging is on.
+
+		Formatting is deferred until here so call sites only pay for it
+		when debugging is enabled. Use %r for raw protocol data since its
+		repr is already printable ASCII.
+		"""
+		if args:
+			fmt = fmt % args
+		print 'TelnetSession[%s]: %s' % (self.name,fmt)
+
 	def send(self,data,secret=False):
 		"""
 		Writes data through our connection transport
+
+		The data is staged in a buffer and flushed under the control of
+		the transport's flow control, so consecutive sends while the
+		transport is busy are coalesced into a single write.
+		"""
+		if secret:
+			self._trace('sending something secret')
+		else:
+			self._trace('sending %r',data)
+		self._txbuf.append(data)
+		if not self._tx_registered:
+			# register ourself as a push producer so the reactor tells us
+			# when to pause and resume writing (the telnet wrapper does not
+			# proxy producer registration, so reach through to its transport)
+			transport = self.transport
+			if not hasattr(transport,'registerProducer'):
+				transport = transport.transport
+			transport.registerProducer(self,True)
+			self._tx_registered = True
+		if not self._tx_paused:
+			self._flush()
+
+	def _flush(self):
 		"""
-		if self.debug:
-			if secret:
-				print 'TelnetSession[%s]: sending something secret' % self.name
-			else:
-				print ('TelnetSession[%s]: sending %r'
-					% (self.name,data.encode('ascii','backslashreplace')))
-		self.transport.write(data)
+		Writes out any buffered data in a single call
+
+		The flush must go through the telnet transport's write so the
+		protocol layer can apply its transformations (IAC doubling and
+		LF to CRLF translation); its writeSequence bypasses them and
+		puts the bytes on the wire raw.
+		"""
+		if self._txbuf:
+			data = ''.join(self._txbuf)
+			self._txbuf = [ ]
+			self.transport.write(data)
+
+	def pauseProducing(self):
+		self._tx_paused = True
+
+	def resumeProducing(self):
+		self._tx_paused = False
+		self._flush()
+
+	def stopProducing(self):
+		self._txbuf = [ ]
 
 	def dataReceived(self,data):
 		"""
 		Drives a state machine based on the input received
 		"""
-		if self.debug:
-			print ("TelnetSession[%s]: got %r in state '%s'" %
-				(self.name,data.encode('ascii','backslashreplace'),self.state))
+		self._trace("got %r in state '%s'",data,self.state)
 		oldState = self.state
-		getattr(self, "session_" + self.state)(data)
-		if self.debug and self.state != oldState:
-			print 'TelnetSession[%s]: entering new state "%s"' % (self.name,self.state)
+		self._state_handlers[self.state](data)
+		if self.state != oldState:
+			self._trace('entering new state "%s"',self.state)
+
+	def _register_state(self,name,method):
+		"""
+		Registers a handler for a state added after construction.
+
+		Subclasses that create states dynamically (rather than defining
+		session_XXX methods) must register them here so dataReceived can
+		dispatch to them.
+		"""
+		self._state_handlers[name] = method
 
 	def session_CONNECTING(self,data):
-		if data.endswith(self.login_prompt):
+		if data[-self._login_plen:] == self.login_prompt:
 			self.state = 'AUTHENTICATING'
 			self.send(self.username+self.end_of_line)
 
 	def session_AUTHENTICATING(self,data):
-		if data.endswith(self.password_prompt):
+		if data[-self._password_plen:] == self.password_prompt:
 			self.send(self.password + self.end_of_line,secret=True)
-		elif data.endswith(self.login_prompt):
+		elif data[-self._login_plen:] == self.login_prompt:
 			self.session_login_failed()
-		elif data.endswith(self.command_prompt):
+		elif data[-len(self.command_prompt):] == self.command_prompt:
 			self.session_started()
 
 	def session_started(self):
@@ -149,54 +253,77 @@ class TelnetSession(telnet.TelnetProtocol,command.CommandQueue):
 		pass
 			
 	def session_COMMAND_LINE_READY(self,data):
-		if self.debug:
-			print 'TelnetSession[%s]: ignoring unsolicited data' % self.name
+		self._trace('ignoring unsolicited data')
 		
 	def session_COMMAND_LINE_BUSY(self,data):
-		(completed,lines) = self.split_data(data)
-		# Append the new lines to the command response.			
-		self.command_response.extend(lines)
-		# Update our state if necessary
-		if completed:
-			if self.debug:
-				print 'TelnetSession[%s]: response from last command:' % self.name
-				for data in self.command_response:
-					print repr(data.encode('ascii','backslashreplace'))
-			self.state = 'COMMAND_LINE_READY'
-			self.done(self.command_response)
-	
-	def split_data(self,data):
+		# Accumulate the data and extract only the newly completed lines,
+		# so a response arriving in many small chunks is not re-split each
+		# time and a prompt straddling a chunk boundary is still seen.
+		self._rxbuf += data
+		eol = self.end_of_line
+		eol_len = len(eol)
+		prompt = self.command_prompt
+		index = self._rxbuf.find(eol)
+		while index >= 0:
+			line = self._rxbuf[:index]
+			self._rxbuf = self._rxbuf[index+eol_len:]
+			if self._pipelined > 0 and line.startswith(prompt):
+				# a mid-stream prompt ends the current command's response;
+				# the rest of the line is the next pipelined command's echo
+				self._complete_command()
+				line = line[len(prompt):]
+			if line.endswith(prompt):
+				# a prompt that arrives with its own line terminator also
+				# completes the command; anything before it on the line is
+				# the final response line
+				line = line[:-len(prompt)]
+				if line:
+					self.command_response.append(line)
+				self._complete_command()
+			# ignore a command echo (and anything received after the last
+			# prompt once no further command is running)
+			elif self.running is not None and (
+				len(self.command_response) > 0 or line != self.running.payload):
+				self.command_response.append(line)
+			index = self._rxbuf.find(eol)
+		# the command is complete once the prompt follows the last line
+		if self._rxbuf.endswith(prompt):
+			self._rxbuf = ''
+			self._complete_command()
+
+	def _complete_command(self):
 		"""
-		Splits received data into lines of command response.
-		
-		Returns a tuple (completed,lines) where completed is true if the
-		data ends with the expected command prompt and lines is an array
-		of new lines received with any initial command echo and the
-		final command prompt removed.
-		"""
-		# Break the data into lines
-		lines = data.split(self.end_of_line)
-		if lines[-1] == '':
-			del lines[-1]
-		# Ignore a command echo
-		if len(self.command_response) == 0 and lines[0] == self.running:
-			del lines[0]
-		# Have we seen all of the command's response now?
-		completed = len(lines) > 0 and lines[-1].endswith(self.command_prompt)
-		if completed:
-			del lines[-1]
-		return (completed,lines)
-		
+		Completes the currently running command with its response lines.
+		"""
+		self._trace('response from last command: %r',self.command_response)
+		self.state = 'COMMAND_LINE_READY'
+		self.done(self.command_response)
+
+
 	def issue(self,command):
 		"""
 		Implements the CommandQueue interface
+
+		Up to COALESCE_MAX queued payloads are coalesced into a single
+		send so that a burst of commands only pays one link round trip.
+		The responses are demultiplexed back into per-command response
+		lists by the prompts that separate them.
 		"""
-		if self.debug:
-			print 'TelnetSession[%s]: issuing the command "%s"' % (self.name,command)
+		self._trace('issuing the command "%s"',command)
+		if self._pipelined > 0:
+			# this payload already went out in an earlier coalesced send,
+			# so just start collecting its response
+			self._pipelined -= 1
+			self.state = 'COMMAND_LINE_BUSY'
+			self.command_response = [ ]
+			return
 		assert(self.state == 'COMMAND_LINE_READY')
 		self.state = 'COMMAND_LINE_BUSY'
 		self.command_response = [ ]
-		self.send(command+self.end_of_line)
+		self._rxbuf = ''
+		payloads = [command] + self.peek(self.COALESCE_MAX - 1)
+		self._pipelined = len(payloads) - 1
+		self.send(self.end_of_line.join(payloads)+self.end_of_line)
 
 
 class TelnetConnection(telnet.TelnetTransport):
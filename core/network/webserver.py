@@ -15,12 +15,42 @@ requests.
 
 from twisted.web import resource,server,static
 from twisted.internet import reactor
+from twisted.internet.interfaces import IPullProducer
+from zope.interface import implements
 
 import re
 
 class SessionState(object):
 	pass
 
+class ChunkProducer(object):
+	"""
+	Streams string chunks from an iterator to a twisted request.
+
+	Registers itself as a pull producer on the request, writes one chunk
+	each time the transport asks for data, and finishes the request when
+	the iterator is exhausted. This lets a handler serve a large response
+	without ever materializing it as a single string: the transport can
+	start sending early chunks while later ones are still being built.
+	Handlers using this should return server.NOT_DONE_YET from GET/POST.
+	"""
+	implements(IPullProducer)
+
+	def __init__(self,request,chunks):
+		self.request = request
+		self.chunks = iter(chunks)
+		request.registerProducer(self,False)
+
+	def resumeProducing(self):
+		try:
+			self.request.write(self.chunks.next())
+		except StopIteration:
+			self.request.unregisterProducer()
+			self.request.finish()
+
+	def stopProducing(self):
+		self.chunks = iter([ ])
+
 class WebQuery(resource.Resource):
 	"""
 	Implements a web resource that handles GET and POST requests.
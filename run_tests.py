@@ -2,14 +2,11 @@
 Finds and runs unit tests
 
 Finds unit tests by recursively searching from the current directory.
-Tests are loaded and run using the standard unittest infrastructure. Any
-directories or files that should not be searched can be added to the
+Tests are discovered and run using the standard unittest infrastructure.
+Any directories or files that should not be searched can be added to the
 ignored array. All other .py files will be imported as part of searching
 for tests, so beware of any import side effects or conflicts from
 importing all modules at once.
-
-TODO:
- - prevent duplicate tests from pkg caused by 'from pkg import *'
 """
 
 ## @package tops.run_tests
@@ -31,57 +28,35 @@ import unittest
 
 if __name__ == '__main__':
 	__file__ = sys.argv[0]
-	
+
 (mypath,myname) = os.path.split(os.path.abspath(__file__))
 mypkg = os.path.basename(mypath)
 
 # directories and files to ignore
 ignored = [myname,'.svn','__init__.py']
 
-suite = unittest.TestSuite()
-
-def path_to_module(name):
-	"""
-	Returns an absolute path converted to a module name under the mypkg tree.
-	"""
-	module = [ ]
-	while name:
-		if name == mypath:
-			module.append(mypkg)
-			break
-		(name,base) = os.path.split(name)
-		module.append(base)
-	module.reverse()
-	return '.'.join(module)
-
-def visit(arg,dirname,names):
+class TestFileLoader(unittest.TestLoader):
 	"""
-	Visits a directory under mypath, importing any .py files and adding
-	any unit tests found to our test suite.
+	Discovers tests in all .py files, skipping ignored and generated ones.
 	"""
-	# is this a python module?
-	if not '__init__.py' in names:
-		del names[:]
-		return
-	dotpath = path_to_module(dirname)
-	print dotpath
-	for name in names[:]:
-		if name in ignored:
-			names.remove(name)
+	def _match_path(self,path,full_path,pattern):
+		if path in ignored:
+			return False
 		# ignore files generated by protoc, which end in _pb2
-		elif name[-3:] == '.py' and not name[-7:] == '_pb2.py':
-			dotname = '%s.%s' % (dotpath,name[:-3])
-			tests = unittest.defaultTestLoader.loadTestsFromName(dotname)
-			print '  %-40s ... %3d test case(s)' % (dotname,tests.countTestCases())
-			suite.addTest(tests)
+		if path[-7:] == '_pb2.py':
+			return False
+		return path[-3:] == '.py'
 
 # print test environment info
 print '## Running %s on %s' % (myname,time.ctime(time.time()))
 print sys.version
 
-# find all tests
+# find all tests using the standard discovery machinery, which caches
+# package imports instead of re-importing every file by hand
 print '\n## Scanning for tests in the module tree of "%s" from %s' % (mypkg,mypath)
-os.path.walk(mypath,visit,None)
+suite = TestFileLoader().discover(mypath,pattern='*.py',
+	top_level_dir=os.path.split(mypath)[0])
+print 'found %d test case(s)' % suite.countTestCases()
 
 # run all tests
 print '\n## Running tests'
@@ -1,9 +1,16 @@
 """
 Parses tcl code to generate web documentation
 
-Designed for semantic analysis of the SDSS legacy IOP code. Uses the PLY
-lexical analyzer (http://www.dabeaz.com/ply/) Run with option --help for
-usage info.
+Designed for semantic analysis of the SDSS legacy IOP code. Uses a
+hand-written tokenizer by default, with the PLY lexical analyzer
+(http://www.dabeaz.com/ply/) available as a fallback. Run with option
+--help for usage info.
+
+TODO:
+ - if the per-token loops ever dominate again, consider compiling the
+   Tokenizer and Parser hot paths as a C extension; this tree is pure
+   Python (the only compiled step is protoc in SConstruct) so that would
+   need new build machinery
 """
 
 ## @package tops.sdss3.design.iop
@@ -20,7 +27,27 @@ class EndOfTokens(Exception):
 class FatalParseError(Exception):
 	pass
 
-import ply.lex as lex
+import bisect
+
+# PLY is only needed for the fallback LexicalAnalyzer; the default
+# Tokenizer is self-contained, so this module works without it.
+try:
+	import ply.lex as lex
+except ImportError:
+	lex = None
+
+# The token class is concrete and never subclassed here, so hot loops can
+# use a direct type test instead of the slower isinstance machinery. Use
+# PLY's LexToken when available so both scanners emit the same type.
+if lex is not None:
+	LEXTOKEN = lex.LexToken
+else:
+	class LEXTOKEN(object):
+		"""
+		A lexical token compatible with PLY's LexToken
+		"""
+		def __repr__(self):
+			return 'LexToken(%s,%r,%d,%d)' % (self.type,self.value,self.lineno,self.lexpos)
 
 class LexicalAnalyzer(object):
 	"""
@@ -48,7 +75,84 @@ class LexicalAnalyzer(object):
 		raise FatalParseError("Illegal character on line %d: '%s'" % (1+t.lineno,t.value))
 
 	def __init__(self):
-		self.lexer = lex.lex(object=self)
+		if lex is None:
+			raise ImportError('PLY is not installed; use the default Tokenizer instead')
+		# optimize=1 caches the generated lexer tables in tclparse_lextab.py
+		# so later runs skip PLY's regex compilation and reflection
+		self.lexer = lex.lex(object=self,optimize=1,lextab='tclparse_lextab')
+
+class Tokenizer(object):
+	"""
+	A hand-written scanner producing the same tokens as LexicalAnalyzer
+
+	The tcl grammar tokenized here is small enough that a direct scan
+	with character-class tables beats PLY's master-regex dispatch and
+	per-token reflection. Emits genuine LexToken instances so the parsing
+	classes below (which tag tokens and test their concrete type) work
+	unchanged, and implements the input()/token()/lexpos interface that
+	File expects. LexicalAnalyzer is retained as a fallback.
+	"""
+	# the single-character literal tokens (the backslash mirrors PLY's
+	# treatment of LexicalAnalyzer.literals, where it can only surface
+	# as a literal when it is the last character of the input)
+	literal_set = frozenset('{}#"[];')
+
+	# characters that terminate a WORD token unless escaped
+	stop_set = frozenset('{}#"[]; \t\n')
+
+	def __init__(self):
+		self.data = ''
+		self.lexpos = 0
+
+	def input(self,data):
+		self.data = data
+		self.lexpos = 0
+
+	def token(self):
+		data = self.data
+		pos = self.lexpos
+		size = len(data)
+		if pos >= size:
+			return None
+		ch = data[pos]
+		if ch in ' \t':
+			# inline whitespace
+			end = pos + 1
+			while end < size and data[end] in ' \t':
+				end += 1
+			ttype = 'WS'
+		elif ch == '\n':
+			# collapse consecutive newlines into one EOL token
+			end = pos + 1
+			while end < size and data[end] == '\n':
+				end += 1
+			ttype = 'EOL'
+		elif ch in self.literal_set or (ch == '\\' and pos + 1 >= size):
+			end = pos + 1
+			ttype = ch
+		else:
+			# a WORD is a run of unescaped non-stop characters
+			stop = self.stop_set
+			end = pos
+			while end < size:
+				c = data[end]
+				if c == '\\':
+					if end + 1 < size:
+						end += 2
+						continue
+					# leave a trailing lone backslash for the next token
+					break
+				if c in stop:
+					break
+				end += 1
+			ttype = 'WORD'
+		tok = LEXTOKEN()
+		tok.type = ttype
+		tok.value = data[pos:end]
+		tok.lexpos = pos
+		tok.lineno = 0
+		self.lexpos = end
+		return tok
 
 from tops.core.utility.html import *
 
@@ -56,37 +160,59 @@ class File(object):
 	"""
 	Represents a parsed tcl file
 	"""
-	def __init__(self,name,title,lexer,debug=0):
+	def __init__(self,name,title,lexer=None,debug=0):
 		"""
 		Prepares a tcl file for parsing
-		
+
 		The title will be used in the HTML output generated by export().
+		By default each file gets its own Tokenizer so input state is
+		independent; pass a lexer explicitly to use a different scanner
+		(e.g., LexicalAnalyzer().lexer for the PLY fallback).
 		A debug level of 0 is silent unless there is a fatal error.
-		Level 1 adds information about the main processing steps.		
+		Level 1 adds information about the main processing steps.
 		Level 2 prints the line numbers where each parsing unit begins
 		and ends. Level 3 also prints each token.
 		"""
-		self.data = ''
+		# read the whole file in one shot
+		f = open(name,'rb')
+		raw = f.read()
+		f.close()
+		# record the offset where each line begins using a C-level scan
 		self.offsets = [ ]
+		if raw:
+			self.offsets.append(0)
+			nl = raw.find('\n')
+			while nl != -1:
+				if nl + 1 < len(raw):
+					self.offsets.append(nl+1)
+				nl = raw.find('\n',nl+1)
+		# freeze for cheaper indexing in the per-token bisect lookups
+		self.offsets = tuple(self.offsets)
+		# replace each escaped newline with two spaces to preserve offsets,
+		# recording where they were so tokens can be restored later
 		self.escapes = [ ]
-		offset = 0
-		for line in open(name):
-			self.offsets.append(offset)
-			offset += len(line)
-			if line[-2:] == '\\\n':
+		pos = raw.find('\\\n')
+		if pos == -1:
+			# common case: no escaped newlines, use the raw buffer as-is
+			self.data = raw
+		else:
+			while pos != -1:
 				if debug > 1:
-					print 'removing escaped newline at end of line',len(self.offsets)
-				# replace an escaped newline with two spaces to preserve offsets
-				self.data += line[:-2]
-				self.data += '  '
-				self.escapes.append(offset-2)
-			else:
-				self.data += line
+					print 'removing escaped newline at end of line',bisect.bisect_right(self.offsets,pos)
+				self.escapes.append(pos)
+				pos = raw.find('\\\n',pos+2)
+			# splice out all the escapes in a single C-level pass
+			self.data = raw.replace('\\\n','  ')
+		self.escapes = tuple(self.escapes)
+		self.nescapes = len(self.escapes)
 		self.nlines = len(self.offsets)
-		self.lexer = lexer
+		# a monotone cursor into offsets used to assign token line numbers:
+		# tokens arrive in increasing lexpos order, so one merge scan over
+		# the offsets covers the whole token stream
+		self._line_index = 0
+		self.lexer = lexer if lexer is not None else Tokenizer()
 		self.title = title
 		self.debug = debug
-		self.last_line = 0
 		self.script = None
 
 	def get_lineno(self,offset=None):
@@ -98,18 +224,12 @@ class File(object):
 		offset is provided, uses the offset where the next token will
 		start.
 		"""
-		if not offset:
+		if offset is None:
 			offset = self.lexer.lexpos
-		# continue from the last line unless we have gone backwards
-		if offset >= self.offsets[self.last_line]:
-			line = self.last_line
-		else:
-			line = 0
-		# scan forwards to find which line the offset is on
-		while line < self.nlines and offset >= self.offsets[line]:
-			line += 1
-		self.last_line = line - 1
-		return line
+		# binary search for the line containing this offset (offsets are
+		# sorted); this handles random access, while the sequential token
+		# stream uses the cheaper merge-scan cursor in next_token
+		return bisect.bisect_right(self.offsets,offset)
 		
 	def next_token(self):
 		"""
@@ -122,19 +242,29 @@ class File(object):
 		token = self.lexer.token()
 		if not token:
 			raise EndOfTokens
-		# store this token's line number based on its file offset
-		token.lineno = self.get_lineno(token.lexpos)
-		# undo any escaped-newline substitution applied to this token's value
+		# store this token's line number based on its file offset, advancing
+		# the merge-scan cursor instead of re-searching from scratch (the
+		# token stream visits the sorted offsets in order, so this is
+		# amortized constant time per token)
 		start = token.lexpos
+		offsets = self.offsets
+		i = self._line_index
+		nlines = self.nlines
+		while i < nlines and offsets[i] <= start:
+			i += 1
+		self._line_index = i
+		token.lineno = i
+		# undo any escaped-newline substitution applied to this token's value
 		end = start + len(token.value)
-		for offset in self.escapes:
-			if offset < start or offset >= end:
-				continue
-			pos = offset - start
+		# binary search for the first escape at or after this token's start
+		# (at most one escape can fall inside a token since the lexer's WORD
+		# pattern does not allow raw newlines)
+		i = bisect.bisect_left(self.escapes,start)
+		if i < self.nescapes and self.escapes[i] < end:
+			pos = self.escapes[i] - start
 			token.value = token.value[:pos] + '\\\n' + token.value[pos+2:]
 			if self.debug > 1:
 				print 'restored escaped newline at end of line',token.lineno
-			break
 		# print out each token if we are being verbose
 		if self.debug > 2:
 			print 'shift',token
@@ -148,6 +278,7 @@ class File(object):
 		"""
 		if self.debug:
 			print 'parsing %s (%d lines)' % (self.title,self.nlines)
+		self._line_index = 0
 		self.lexer.input(self.data)
 		try:
 			self.script = Script(self,self.debug)
@@ -189,6 +320,7 @@ class Parser(object):
 		self.embedded = embedded
 		self.depth = depth
 		self.tokens = [ ]
+		self._token_stream_cache = None
 		self.name = self.__class__.__name__
 		if debug > 1:
 			arrow = '-'*self.depth + '>'
@@ -224,12 +356,16 @@ class Parser(object):
 		Works recursively on any embedded parsing objects to flatten the
 		token stream that is returned and only return LexToken objects.
 		Our own prefix or suffix tokens, if any, are not included but
-		those of any descendents are.
+		those of any descendents are. The flattened stream is cached so
+		that repeated calls (e.g., during embedded-script replay) do not
+		walk the tree again.
 		"""
+		if self._token_stream_cache is not None:
+			return self._token_stream_cache
 		stream = [ ]
 		for tok in self.tokens:
 			# emit a lexical token directly
-			if isinstance(tok,lex.LexToken):
+			if type(tok) is LEXTOKEN:
 				stream.append(tok)
 			else:
 				# emit parsed object's prefix token, if any
@@ -240,45 +376,67 @@ class Parser(object):
 				# emit parsed object's suffix token, if any
 				if tok.suffix_token:
 					stream.append(tok.suffix_token)
+		self._token_stream_cache = stream
 		return stream
 
 	def reconstruct(self):
 		"""
 		Reconstructs the string that was parsed to create this instance
-		
+
 		Sublcasses should provide appropriate values for the prefix and
 		suffix class attributes to define their wrapper tokens.
 		"""
-		data = self.prefix
+		parts = [ ]
+		self._reconstruct_into(parts)
+		return ''.join(parts)
+
+	def _reconstruct_into(self,parts):
+		"""
+		Appends this instance's reconstructed text fragments to parts
+
+		Accumulating fragments into a shared list and joining once at the
+		root avoids allocating an intermediate string per subtree.
+		"""
+		parts.append(self.prefix)
 		for token in self.tokens:
-			if isinstance(token,Parser):
-				data += token.reconstruct()
+			if type(token) is LEXTOKEN:
+				parts.append(token.value)
 			else:
-				data += token.value
-		data += self.suffix
-		return data
+				token._reconstruct_into(parts)
+		parts.append(self.suffix)
 		
 	def export(self,container):
 		"""
 		Fills the DOM container with an HTML description of this instance
 		"""
+		container.append(self._export_content())
+
+	def _export_content(self):
+		"""
+		Builds and returns the Span element describing this instance
+
+		Children are collected into a list and added to the DOM in one
+		extend call rather than registering them one append at a time.
+		"""
 		content = Span(className=self.name,title=self.name)
+		children = [ ]
 		if self.prefix:
-			content.append(self.prefix)
+			children.append(self.prefix)
 		for token in self.tokens:
 			if isinstance(token,Parser):
-				token.export(content)
-			elif isinstance(token,lex.LexToken):
+				children.append(token._export_content())
+			elif type(token) is LEXTOKEN:
 				# is this literal tagged?
 				if hasattr(token,'tag'):
-					content.append(Span(token.value,id=token.tag,className='tagged'))
+					children.append(Span(token.value,id=token.tag,className='tagged'))
 				else:
-					content.append(token.value)
+					children.append(token.value)
 			else:
 				print 'export: ignoring illegal token "%s"' % token
 		if self.suffix:
-			content.append(self.suffix)
-		container.append(content)
+			children.append(self.suffix)
+		content.extend(children)
+		return content
 		
 	def append(self,type_or_value,*type_args):
 		"""
@@ -301,10 +459,12 @@ class Parser(object):
 			parsed.prefix_token = prefix
 			parsed.suffix_token = suffix
 			self.tokens.append(parsed)
-		elif isinstance(type_or_value,lex.LexToken):
+		elif type(type_or_value) is LEXTOKEN:
 			self.tokens.append(type_or_value)
 		else:
 			raise FatalParseError('append: unrecognized token type: %r' % type_or_value)
+		# our flattened token stream is stale now
+		self._token_stream_cache = None
 			
 	def embed(self):
 		"""
@@ -315,6 +475,7 @@ class Parser(object):
 		try:
 			reparsed = EmbeddedScript(self.tokenizer,self.debug,self.depth+1,parent=self)
 			self.tokens[:] = [reparsed]
+			self._token_stream_cache = None
 		except FatalParseError,e:
 			if self.debug:
 				print ('re-parsing of %s on line %d as embedded script failed: %s'
@@ -383,10 +544,18 @@ class Command(Parser):
 	whitespace between words is preserved so that the original file can
 	be exactly reconstructed after parsing.
 	"""
+	# maps a word-opening token type to the Parser subclass that handles it
+	# (filled in at the bottom of this module once the classes are defined)
+	dispatch = { }
+
 	def parse(self,debug):
+		# hoist the bound methods used once per token out of the loop
+		dispatch = self.dispatch
+		next_token = self.next
+		append = self.append
 		while True:
 			try:
-				token = self.next(end_is_fatal=False)
+				token = next_token(end_is_fatal=False)
 			except EndOfTokens:
 				if len(self.tokens) > 0:
 					if debug > 2:
@@ -395,40 +564,39 @@ class Command(Parser):
 				else:
 					raise
 			if token.type in (';','EOL'):
-				self.append(token)
+				append(token)
 				break
 			elif token.type == '#':
 				# only white space can precede a valid comment
 				is_comment = True
 				for tok in self.tokens:
-					if not isinstance(tok,lex.LexToken):
+					if type(tok) is not LEXTOKEN:
 						is_comment = False
 						break
 					if not tok.type in ('WS','EOL'):
 						is_comment = False
 						break
 				if is_comment:
-					self.append(Comment)
+					append(Comment)
 					break
 				else:
 					if debug > 1:
 						print 'found non-comment # in command on line %d' % token.lineno
-					self.append(token)
-			elif token.type == '[':
-				self.append(Substitution)
-			elif token.type == '"':
-				self.append(Quoted)
-			elif token.type == '{':
-				self.append(Group)
+					append(token)
 			else:
-				self.append(token)
+				# a single dict lookup replaces an if/elif chain per token
+				parser = dispatch.get(token.type)
+				if parser:
+					append(parser)
+				else:
+					append(token)
 		# Extract the words of this command, if any, ignoring whitespace and comments,
 		# and any final semicolon. Tokens that are not separated by white space are grouped
 		# into a single word.
 		self.words = [ ]
 		index = 0
 		for tok in self.tokens:
-			if isinstance(tok,lex.LexToken) and tok.type in ('WS','EOL',';'):
+			if type(tok) is LEXTOKEN and tok.type in ('WS','EOL',';'):
 				if tok.type == 'WS' and len(self.words) > 0:
 					index += 1
 				continue
@@ -444,7 +612,7 @@ class Command(Parser):
 		if debug > 1:
 			for (index,word) in enumerate(self.words):
 				print 'command word[%d] is [%s]' % (index,','.join([
-					'"%s"'%tok.value if isinstance(tok,lex.LexToken)
+					'"%s"'%tok.value if type(tok) is LEXTOKEN
 						else '<%s>'%tok.name for tok in word]))
 		# do we have a literal base word?
 		baseword = self.word_literal(0)
@@ -488,6 +656,7 @@ class Command(Parser):
 					print 'added "%s" to command dictionary on line %d' % (proc_name,cmd_lineno)
 			# tag the procedure name for our HTML markup
 			self.words[1][0].tag = tag
+			self.tagged.append((proc_name,self.words[1][0]))
 		elif baseword == 'if':
 			# Process a tcl 'if' command: http://www.tcl.tk/man/tcl8.4/TclCmd/if.htm
 			if debug > 1:
@@ -538,7 +707,7 @@ class Command(Parser):
 			return None
 		if len(word) > 1:
 			return None
-		if isinstance(token,lex.LexToken) and token.type == 'WORD':
+		if type(token) is LEXTOKEN and token.type == 'WORD':
 			return token.value
 		else:
 			return None		
@@ -550,6 +719,12 @@ class Command(Parser):
 	"""
 	dictionary = { }
 
+	# The (proc_name,token) tag assignments in definition order. A worker
+	# process numbers duplicate procedures relative to its own file only,
+	# so the parent needs this list to renumber the exported tags to
+	# match the global numbering that build_index uses for its anchors.
+	tagged = [ ]
+
 	@staticmethod
 	def build_index(title=None):
 		"""
@@ -608,15 +783,23 @@ class Quoted(Parser):
 	prefix = '"'
 	suffix = '"'
 
+	# maps nested token types to their Parser subclasses (filled in at the
+	# bottom of this module once the classes are defined)
+	dispatch = { }
+
 	def parse(self,debug):
+		dispatch = self.dispatch
+		next_token = self.next
+		append = self.append
 		while True:
-			token = self.next()
-			if token.type == '[':
-				self.append(Substitution)
-			elif token.type == '"':
+			token = next_token()
+			if token.type == '"':
 				break
+			parser = dispatch.get(token.type)
+			if parser:
+				append(parser)
 			else:
-				self.append(token)
+				append(token)
 
 class Group(Parser):
 	"""
@@ -632,16 +815,22 @@ class Group(Parser):
 	"""
 	prefix = '{'
 	suffix = '}'
-	
+
+	dispatch = { }
+
 	def parse(self,debug):
+		dispatch = self.dispatch
+		next_token = self.next
+		append = self.append
 		while True:
-			token = self.next()
-			if token.type == '{':
-				self.append(Group)
-			elif token.type == '}':
+			token = next_token()
+			if token.type == '}':
 				break
+			parser = dispatch.get(token.type)
+			if parser:
+				append(parser)
 			else:
-				self.append(token)
+				append(token)
 
 class Substitution(Parser):
 	"""
@@ -649,26 +838,79 @@ class Substitution(Parser):
 	"""
 	prefix = '['
 	suffix = ']'
-	
+
+	dispatch = { }
+
 	def parse(self,debug):
+		dispatch = self.dispatch
+		next_token = self.next
+		append = self.append
 		while True:
-			token = self.next()
+			token = next_token()
 			if token.type == ']':
 				break
-			elif token.type == '[':
-				self.append(Substitution)
-			elif token.type == '{':
-				self.append(Group)
+			parser = dispatch.get(token.type)
+			if parser:
+				append(parser)
 			else:
-				self.append(token)
+				append(token)
 		# now that we have captured the whole substitution text, try to
 		# re-parse it as an embedded script
-		self.embed()			
+		self.embed()
+
+# fill in the token dispatch tables now that the handler classes exist
+Command.dispatch = { '[': Substitution, '"': Quoted, '{': Group }
+Quoted.dispatch = { '[': Substitution }
+Group.dispatch = { '{': Group }
+Substitution.dispatch = { '[': Substitution, '{': Group }
 
 import sys
 import os,os.path
 import shutil
 
+def scrub_tokens(parser):
+	"""
+	Removes lexer references from a parse tree so it can be pickled
+
+	PLY attaches the active lexer (which holds compiled regular
+	expressions) to every token it produces, and compiled patterns cannot
+	be shipped between processes.
+	"""
+	for tok in parser.tokens:
+		if type(tok) is LEXTOKEN:
+			if hasattr(tok,'lexer'):
+				del tok.lexer
+		else:
+			for t in (tok.prefix_token,tok.suffix_token):
+				if t is not None and hasattr(t,'lexer'):
+					del t.lexer
+			scrub_tokens(tok)
+
+def parse_file(args):
+	"""
+	Parses a single tcl file, suitable for running in a worker process
+
+	Builds its own lexical analyzer since compiled lexers cannot be
+	pickled between processes. Returns the parsed File together with this
+	file's fragment of the procedure dictionary and its tag assignments,
+	so the parent process can merge the fragments deterministically and
+	renumber duplicate-procedure tags globally. The returned File is
+	scrubbed of lexer references so it survives the trip back through
+	pickle; the tag assignments share one pickle with the parse tree, so
+	they still reference the tree's own token objects on arrival.
+	"""
+	(name,title,debug) = args
+	# start a fresh dictionary and tag list so the fragment only covers
+	# this file
+	Command.dictionary = { }
+	Command.tagged = [ ]
+	f = File(name,title,debug=debug)
+	f.parse()
+	f.lexer = None
+	if f.script:
+		scrub_tokens(f.script)
+	return (f,Command.dictionary,Command.tagged)
+
 def main():
 
 	from optparse import OptionParser
@@ -681,9 +923,11 @@ def main():
 		help="output path (created if necessary, omit for no output)")
 	options.add_option("-R","--recursive",action="store_true",
 		help="recursively visit all source tcl files (%default by default)")
+	options.add_option("-j","--jobs",type="int",metavar="INT",
+		help="number of parallel parsing processes (default is %default)")
 	options.add_option("--title",
 		help="title to use for master index web page (default is %default)")
-	options.set_defaults(debug=0,recursive=False,title='Command Index')
+	options.set_defaults(debug=0,recursive=False,jobs=1,title='Command Index')
 	(opts,args) = options.parse_args()
 
 	# validate command-line options
@@ -697,44 +941,64 @@ def main():
 		print 'no such source: %s' % source
 		sys.exit(-2)
 
-	# one-time initialization of lexical analyzer
-	lexer = LexicalAnalyzer().lexer
-	
 	# the list of files we have parsed
 	parsed_files = [ ]
 	total_lines = 0
-	
-	# parse the source files
+
+	# collect the (name,title,debug) parse jobs
+	jobs = [ ]
 	if os.path.isfile(source):
 		# process a single file
-		title = os.path.basename(source)
-		f = File(source,title,lexer,opts.debug)
-		f.parse()
-		parsed_files.append(f)
-		total_lines += f.nlines
+		jobs.append((source,os.path.basename(source),opts.debug))
 	else:
 		# walk through the source tree
 		for (root,dirs,files) in os.walk(source):
 			if not opts.recursive:
 				del dirs[:]
 			# calculate the output path relative to the command-line 'source'
-			# and the return path to the source
-			(ipath,opath) = (root,'')
-			while not os.path.samefile(ipath,source):
-				(ipath,segment) = os.path.split(ipath)
-				opath = os.path.join(segment,opath)
+			# (relpath is a pure string computation with no stat traffic)
+			opath = os.path.relpath(root,source)
+			if opath == '.':
+				opath = ''
 			# loop over files in this source directory
 			for filename in files:
 				# we are only interested in tcl files
-				(base,ext) = os.path.splitext(filename)
-				if ext != '.tcl':
+				if not filename.endswith('.tcl'):
 					continue
-				name = os.path.join(root,filename)
-				title = os.path.join(opath,filename)
-				f = File(name,title,lexer,opts.debug)
-				f.parse()
-				parsed_files.append(f)
-				total_lines += f.nlines
+				jobs.append((os.path.join(root,filename),os.path.join(opath,filename),opts.debug))
+
+	# parse the source files, fanning out across worker processes if
+	# requested (file parsing is CPU bound and independent per file;
+	# pool.map returns results in job order, so the merge and tag
+	# renumbering below are deterministic)
+	if opts.jobs > 1:
+		import multiprocessing
+		pool = multiprocessing.Pool(opts.jobs)
+		results = pool.map(parse_file,jobs)
+		pool.close()
+	else:
+		results = [ ]
+		for (name,title,debug) in jobs:
+			f = File(name,title,debug=debug)
+			f.parse()
+			results.append((f,None,None))
+	# running count of definitions per procedure across all files, used
+	# to renumber duplicate-procedure tags after a parallel parse
+	proc_counts = { }
+	for (f,fragment,tagged) in results:
+		parsed_files.append(f)
+		total_lines += f.nlines
+		if fragment is not None:
+			# merge this worker's dictionary fragment in job order
+			for (proc,titles) in fragment.iteritems():
+				Command.dictionary.setdefault(proc,[ ]).extend(titles)
+			# Workers number duplicate procedures relative to their own
+			# file; renumber the exported tags so they line up with the
+			# global numbering build_index uses for its anchors.
+			for (proc,token) in tagged:
+				n = proc_counts.get(proc,0) + 1
+				proc_counts[proc] = n
+				token.tag = proc if n == 1 else '%s_%d' % (proc,n)
 	if not opts.output:
 		sys.exit(0)
 	# create the output path if necessary
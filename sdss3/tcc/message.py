@@ -1,5 +1,12 @@
 """
 Parses the message format generated by the TCC interpreter
+
+TODO: should line parsing ever dominate a profile despite the result
+cache, the next step would be rewriting parse() as a compiled
+extension with a hand-written character-level state machine (the
+grammar is LL(1) outside of string literals). Nothing in this tree is
+compiled today apart from the protoc step in SConstruct, so that move
+would need build machinery this project has deliberately avoided.
 """
 
 ## @package tops.sdss3.tcc.message
@@ -14,7 +21,11 @@ Parses the message format generated by the TCC interpreter
 patterns = {
 	'unsigned':		'0|[1-9][0-9]*',
 	'hex':			'0x[0-9a-f]+',
-	'string':		r'"(?:[^"\\]|\\.)*"',
+	# The string rule uses the unrolled-loop form rather than the more
+	# obvious "(?:[^"\\]|\\.)*" so there is only one way to match any
+	# given literal; the ambiguous form can backtrack catastrophically
+	# on long malformed lines.
+	'string':		r'"[^"\\]*(?:\\.[^"\\]*)*"',
 	'pname':		'[A-Za-z0-9_]+',
 	'from':			'\[from[^\]]+\]',
 	'status':		'[\:IWF>]'
@@ -28,17 +39,21 @@ patterns['decimal'] = '[-+]?(?:(?:(?:%(unsigned)s)(?:\.[0-9]*)?)|(?:\.[0-9]+))'
 # - A flooating-point decimal number with an optional exponent that might also be NaN
 patterns['float'] = '(?:(?:%(decimal)s)(?:[eE][-+]?[0-9]+)?)|NaN' % patterns
 
-# - A hex or decimal number
-patterns['number'] = '(?:%(hex)s)|(?:%(float)s)' % patterns
+# - A hex or decimal number (hex and string below are plain
+#   concatenations, so they need no wrapping group of their own; every
+#   inlined copy of a pattern grows the compiled program the engine has
+#   to traverse, and the stdlib engine cannot share subpatterns)
+patterns['number'] = '%(hex)s|(?:%(float)s)' % patterns
 
 # - A parameter value which is either a number or a string
-patterns['pvalue'] = '(?:%(number)s)|(?:%(string)s)' % patterns
+patterns['pvalue'] = '(?:%(number)s)|%(string)s' % patterns
 
 # - An array of one or more parameter values separated by commas.
 patterns['array'] = '(?:%(pvalue)s)(?:\s*,\s*(?:%(pvalue)s))*' % patterns
 
-# - A parameter declaration (which might not have an assignment)
-patterns['passign'] = '(?:%(pname)s)(?:\s*=\s*(?:%(array)s))?' % patterns
+# - A parameter declaration (which might not have an assignment);
+#   pname is a single character-class atom so it needs no group
+patterns['passign'] = '%(pname)s(?:\s*=\s*(?:%(array)s))?' % patterns
 
 # - A sequence of one or more parameter declarations separated by semicolons.
 patterns['pseq'] = '(?:%(passign)s)(?:\s*;\s*(?:%(passign)s))*' % patterns
@@ -62,58 +77,139 @@ status_codes = {
 
 # compiled regular expressions used by the parser
 import re
-msgScanner = re.compile('%(msg)s$' % patterns)
-declSplitter = re.compile('(%(passign)s)' % patterns)
+# Use the linear-time RE2 engine for the big message scanner when its
+# python wrapper is installed. The msg grammar has no backreferences or
+# lookarounds, so both engines accept exactly the same language; RE2
+# just guarantees linear-time matching however malformed the line is.
+try:
+	import re2 as _re2
+	# RE2 has no \Z escape, but its $ anchors to end-of-text (it never
+	# matches just before a trailing newline the way the stdlib $ does)
+	msgScanner = _re2.compile('%(msg)s$' % patterns)
+except ImportError:
+	# \Z anchors to the true end of the string, so a successful match
+	# is automatically a full match and no end() check is needed
+	msgScanner = re.compile('%(msg)s\\Z' % patterns)
 declScanner = re.compile('(%(pname)s)(?:\s*=\s*(%(array)s))?' % patterns)
-valSplitter = re.compile('(%(pvalue)s)' % patterns)
+valScanner = re.compile('(%(pvalue)s)' % patterns)
+
+# Parsed results for recently seen lines. The TCC repeats many status
+# lines verbatim, so a hit here replaces the whole regex and splitting
+# pass with a single dict lookup. Like the re module's own pattern
+# cache, this one is simply cleared when it fills up.
+_parse_cache = { }
+_PARSE_CACHE_SIZE = 4096
+
+# The status characters accepted by the msg pattern (must agree with
+# patterns['status']), as a set so the pre-filter below classifies the
+# status byte with one hash probe instead of a character scan.
+_status_chars = frozenset(':IWF>')
+
+# Generous upper bound on a plausible TCC message line. Refusing longer
+# input before the scanners run puts a hard ceiling on how much work
+# the backtracking engine can be made to do on pathological lines.
+MAX_LINE_LENGTH = 4096
+
+def iter_decls(pseq):
+	"""
+	Yields (name,values) pairs from a validated declaration sequence.
+
+	values is a tuple of the declared array values, empty when the
+	declaration carries no assignment. The pairs are produced lazily,
+	so a caller looking for one particular parameter can stop
+	consuming without paying to split the rest of the sequence.
+	"""
+	for parsed in declScanner.finditer(pseq):
+		(keyword,val_string) = parsed.groups()
+		if val_string:
+			# collect the array values directly (a tuple, so cached
+			# results stay immutable); findall yields just the value
+			# matches, with no interleaved separator strings to
+			# build and throw away
+			values = tuple(valScanner.findall(val_string))
+		else:
+			values = ()
+		# parameter names come from a small fixed vocabulary, so
+		# interning them lets every parsed line share one copy
+		yield (intern(keyword),values)
 
 def parse(line):
 	"""
 	Attempts to parse a line of text as a TCC message.
+
+	Results are cached by line and shared between callers, so the
+	returned keywords dictionary and value tuples must not be modified.
+
+	Lines are the plain byte strings that come off the socket; the
+	grammar is pure ASCII and the scanners match the bytes directly,
+	with no decoding step anywhere on the path.
 	"""
+	try:
+		return _parse_cache[line]
+	except KeyError:
+		pass
+	if len(line) > MAX_LINE_LENGTH:
+		raise MessageError('line too long: %d characters' % len(line))
+	# Cheap pre-filter: a message must open with two space-separated
+	# integers and a status character, so most garbage lines can be
+	# rejected with C-level find/isdigit before paying to set up the
+	# regex state machine. These checks accept a superset of what
+	# msgScanner accepts, so nothing valid is turned away here.
+	s = line[1:] if line[:1] == '\r' else line
+	i = s.find(' ')
+	j = s.find(' ',i+1)
+	if (i <= 0 or j <= i+1 or not s[:i].isdigit() or not s[i+1:j].isdigit()
+		or s[j+1:j+2] not in _status_chars):
+		raise MessageError('badly formed line: %r' % line)
 	parsed = msgScanner.match(line)
 	if not parsed:
 		raise MessageError('badly formed line: %r' % line)
-	if parsed.end() < len(line):
-		raise MessageError('unexpected trailing characters on line: %r' % line)
 	(mystery_num,user_num,status,pseq) = parsed.groups()
 	try:
 		mystery_num = int(mystery_num)
 		user_num = int(user_num)
 	except ValueError:
 		raise MessageError('internal error parsing integer on line: %r' % line)
-	if status in status_codes:
-		status = status_codes[status]
+	# One hash lookup, falling back to the raw character for codes we
+	# do not recognize. The result is interned since the same handful
+	# of status strings recur across millions of lines.
+	status = intern(status_codes.get(status,status))
 	# The line might not have any parameter values, e.g.
 	# 0 3 : [from 'gcamera status' and 'broadcast...']
 	if not pseq:
-		return (mystery_num,user_num,status,pseq)
-	# split up the parameter declaration sequence
-	declarations = declSplitter.split(pseq)
-	keywords = { }
-	for declaration in declarations[1::2]:
-		# parse a parameter declaration
-		parsed = declScanner.match(declaration)
-		if not parsed:
-			raise MessageError('badly formed declaration: %r' % declaration)
-		if parsed.end() < len(declaration):
-			raise MessageError('unexpected trailing characters on decl: %r' % declaration)
-		(keyword,val_string) = parsed.groups()
-		if val_string:
-			# split up the values array
-			values = valSplitter.split(val_string)
-		else:
-			values = [ ]
-		keywords[keyword] = values[1::2]
-	return (mystery_num,user_num,status,keywords)
+		result = (mystery_num,user_num,status,pseq)
+	else:
+		# Walk the parameter declarations in a single lazy pass.
+		# msgScanner has already validated pseq, so the declaration
+		# matches are exactly the semicolon-separated assignments and
+		# nothing can fail to match.
+		result = (mystery_num,user_num,status,dict(iter_decls(pseq)))
+	if len(_parse_cache) >= _PARSE_CACHE_SIZE:
+		_parse_cache.clear()
+	_parse_cache[line] = result
+	return result
 
 import unittest
 
+# Anchored patterns for the tests below, compiled on first use and
+# cached, so that importing this module just for parse() does not pay
+# for more than a dozen extra pattern compilations.
+_test_patterns = { }
+
+def _test_pattern(name):
+	try:
+		return _test_patterns[name]
+	except KeyError:
+		# wrap before anchoring: a bare \Z would bind only to the last
+		# branch of a pattern with a top-level alternation
+		p = _test_patterns[name] = re.compile('(?:%s)\\Z' % patterns[name])
+		return p
+
 class MessageTests(unittest.TestCase):
 
 	def check(self,p,text,valid):
-		m = p.match(text)
-		matched = m and m.end() == len(text)
+		# the patterns are \Z-anchored, so any match is a full match
+		matched = p.match(text) is not None
 		if valid and not matched:
 			raise Exception("'%s' does not match '%s'" % (text,p.pattern))
 		elif not valid and matched:
@@ -121,19 +217,19 @@ class MessageTests(unittest.TestCase):
 
 	def test00(self):
 		"""Valid unsigned integers"""
-		p = re.compile("%(unsigned)s$" % patterns)
+		p = _test_pattern('unsigned')
 		for text in ['0','1','12','120','102']:
 			self.check(p,text,True)
 
 	def test01(self):
 		"""Invalid unsigned integers"""
-		p = re.compile("%(unsigned)s$" % patterns)
+		p = _test_pattern('unsigned')
 		for text in ['abc','00','01','001','-1','-0']:
 			self.check(p,text,False)
 
 	def test02(self):
 		"""Valid floating-point numbers"""
-		p = re.compile("%(float)s$" % patterns)
+		p = _test_pattern('float')
 		for text in [
 			'0','1','12','120','102','1.','-1','+.3','-1.','0.23','1e1','1e-1','-1e+1','.2','-.2'
 		]:
@@ -141,37 +237,37 @@ class MessageTests(unittest.TestCase):
 
 	def test03(self):
 		"""Invalid floating-point numbers"""
-		p = re.compile("%(float)s$" % patterns)
+		p = _test_pattern('float')
 		for text in ['abc','0e','e0','1.2.3','1e-+2','+1-2']:
 			self.check(p,text,False)
 
 	def test04(self):
 		"""Valid double-quoted string literals"""
-		p = re.compile("%(string)s$" % patterns)
+		p = _test_pattern('string')
 		for text in ['""','"a"','"abc"','";"',r'"spawn \"show users\""']:
 			self.check(p,text,True)
 
 	def test05(self):
 		"""Invalid double-quoted string literals"""
-		p = re.compile("%(string)s$" % patterns)
+		p = _test_pattern('string')
 		for text in ["'abc'",'abc','"a"bc','ab"c"']:
 			self.check(p,text,False)
 
 	def test06(self):
 		"""Valid array of numeric values"""
-		p = re.compile("%(array)s$" % patterns)
+		p = _test_pattern('array')
 		for text in ['1.2','1.2,3.4','0','0xdeadbeef','0x123 ,-1.23','4728232973.56']:
 			self.check(p,text,True)
 
 	def test07(self):
 		"""Invalid array of numeric values"""
-		p = re.compile("%(array)s$" % patterns)
+		p = _test_pattern('array')
 		for text in ['1.2,',',1.2','1.2,3.4,']:
 			self.check(p,text,False)
 
 	def test08(self):
 		"""Valid parameter assignment"""
-		p = re.compile("%(passign)s$" % patterns)
+		p = _test_pattern('passign')
 		for text in [
 			'Text="827800 packets sent successfully"',
 			'UT1=  4728232973.56',
@@ -186,13 +282,13 @@ class MessageTests(unittest.TestCase):
 
 	def test09(self):
 		"""Invalid parameter assignment"""
-		p = re.compile("%(passign)s$" % patterns)
+		p = _test_pattern('passign')
 		for text in ['1.2,',',1.2','1.2,3.4,']:
 			self.check(p,text,False)
 
 	def test10(self):
 		"""Valid parameter assignment sequences"""
-		p = re.compile("%(pseq)s$" % patterns)
+		p = _test_pattern('pseq')
 		for text in [
 			'TCCStatus="HHH","NNN"; TCCPos=NaN,NaN,NaN; AxePos=121.00,30.00,0.00',
 			'AxisErrCode="HaltRequested","HaltRequested","HaltRequested"',
@@ -204,13 +300,13 @@ class MessageTests(unittest.TestCase):
 
 	def test11(self):
 		"""Invalid parameter assignment sequences"""
-		p = re.compile("%(pseq)s$" % patterns)
+		p = _test_pattern('pseq')
 		for text in ['1.2,',',1.2','1.2,3.4,']:
 			self.check(p,text,False)
 
 	def test12(self):
 		"""Valid messages"""
-		p = re.compile("%(msg)s$" % patterns)
+		p = _test_pattern('msg')
 		for text in [
 			'0 3 : Cmd="axis status all"',
 			"0 3 : [from 'gcamera status' and 'broadcast...']",
@@ -227,7 +323,7 @@ class MessageTests(unittest.TestCase):
 
 	def test13(self):
 		"""Invalid messages"""
-		p = re.compile("%(msg)s$" % patterns)
+		p = _test_pattern('msg')
 		for text in ['1.2,',',1.2','1.2,3.4,']:
 			self.check(p,text,False)
 
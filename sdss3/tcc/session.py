@@ -141,20 +141,22 @@ class TCCSession(VMSSession):
 		when = AstroTime.fromMJD(mjdtai,TAI)
 		return when.astimezone(UTC)
 
+# compiled once at module load since got_users runs on a periodic timer
+users_parser = re.compile('\s*(TCC|TCCUSER)\s+([0-9]+)')
+
 def got_users(response):
-		users = { 'TCC':0, 'TCCUSER':0 }
-		parser = re.compile('\s*(TCC|TCCUSER)\s+([0-9]+)')
-		for line in response:
-				match = parser.match(line)
-				if match:
-						users[match.group(1)] = int(match.group(2))
-		for (username,nproc) in users.iteritems():
-				print '%s is running %d processes' % (username,nproc)
-		utc = AstroTime.now(UTC)
-		archiving.update(utc,'vms',{
-				'nproc.tcc':			users['TCC'],
-				'nproc.tccuser':		users['TCCUSER']
-		})
+	users = { 'TCC':0, 'TCCUSER':0 }
+	for line in response:
+		match = users_parser.match(line)
+		if match:
+			users[match.group(1)] = int(match.group(2))
+	for (username,nproc) in users.iteritems():
+		print '%s is running %d processes' % (username,nproc)
+	utc = AstroTime.now(UTC)
+	archiving.update(utc,'vms',{
+		'nproc.tcc':			users['TCC'],
+		'nproc.tccuser':		users['TCCUSER']
+	})
 
 def show_users():
 	TelnetSession.do('VMS','show users').addCallback(got_users)